@@ -1,22 +1,36 @@
 # Import the asyncio library, which provides infrastructure for writing asynchronous code
 import asyncio
 
+# Import logging so per-message output can be switched off without formatting it
+import logging
+
+# Import signal to shut down cleanly on Ctrl+C
+import signal
+
 # Import the websockets library, which implements the WebSocket protocol
 import websockets
+from websockets.asyncio.server import serve
+
+# Import the helpers shared by the test servers
+from server_common import run, set_tcp_nodelay, setup_logging
+
+logger = logging.getLogger(__name__)
 
 break_loop = False
-# Import colorama for colored terminal output
-from colorama import Fore, Style, init
 
-# Initialize colorama
-init(autoreset=True)
+# Large payload sent after the second message; built once instead of per loop
+LARGE_DATA = b"A" * 905000  # ~1 million 'A' bytes
+# Transport write buffer high-water mark (write_limit); above len(LARGE_DATA),
+# so queueing LARGE_DATA does not wait for a drain
+SEND_BUFFER_SIZE = 1 << 20
 
 
 # Define an asynchronous function named 'echo' that handles WebSocket connections
 # The 'async' keyword indicates that this function can be paused and resumed
 async def echo(websocket):
     # print(f"New connection: with address {websocket.remote_address} and port {websocket.port}")
-    print(f"New connection")
+    set_tcp_nodelay(websocket)
+    logger.info("New connection")
     try:
         while not break_loop:
             # Receive a message from the client
@@ -24,75 +38,85 @@ async def echo(websocket):
             if message is None:
                 break
 
-            # Print the received message to the console in green
-            print(f"Received: {Fore.GREEN}{message}{Style.RESET_ALL}")
+            # Log the received message
+            logger.debug("Received: %s", message)
             # Send the same message back to the client
             # The 'await' keyword is used to pause execution until the send operation is complete
             await websocket.send(message)
-            print(f"Sent: {Fore.YELLOW}{message}{Style.RESET_ALL}")
+            logger.debug("Sent: %s", message)
 
             # Send an additional message to the client
             additional_message = "Server received your message!"
             await websocket.send(additional_message)
-            print(
-                f"Sent additional message: {Fore.YELLOW}{additional_message}{Style.RESET_ALL}"
+            logger.debug(
+                "Sent additional message: %s",
+                additional_message,
             )
 
             # Receive another message from the client
             second_message = await websocket.recv()
             if second_message is None:
                 break
-            print(
-                f"Received second message: {Fore.GREEN}{second_message}{Style.RESET_ALL}"
+            logger.debug(
+                "Received second message: %s",
+                second_message,
             )
 
             await asyncio.sleep(10)
             # Send a large data response
-            large_data = "A" * 905000  # 1 million 'A' characters
-            await websocket.send(large_data)
-            print(
-                f"Sent large data response: {Fore.YELLOW}[1 million 'A' characters]{Style.RESET_ALL}"
+            await websocket.send(LARGE_DATA)
+            logger.debug(
+                "Sent large data response: [1 million 'A' characters]"
             )
 
             # Send a final response
             # final_response = "Thank you for your messages. Goodbye!"
             # await websocket.send(final_response)
-            # print(f"Sent final response: {Fore.YELLOW}{final_response}{Style.RESET_ALL}")
+            # print(f"Sent final response: {final_response}")
 
     except websockets.exceptions.ConnectionClosedError as e:
         # If the connection is closed unexpectedly, this exception is caught
         # We simply pass, effectively closing the connection gracefully
-        print(f"\nConnection closed reason: CLIENT DISCONNECTED: {e}\n\n")
+        logger.info("\nConnection closed reason: CLIENT DISCONNECTED: %s\n\n", e)
 
 
 # Define an asynchronous function named 'main' that sets up the server
 async def main():
     global break_loop
+    # Log to the console; set LOG_LEVEL=DEBUG to see every message
+    setup_logging(logger)
+
     # Create a WebSocket server using the 'serve' function from the websockets library
     # It will use the 'echo' function to handle connections, listen on 'localhost' at port 8765
+    # permessage-deflate stays enabled: LARGE_DATA is highly repetitive and shrinks a lot
+    # Ctrl+C sets 'stop'; leaving the 'async with' block closes the server
+    stop = asyncio.Event()
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGINT, stop.set)
+    except NotImplementedError:
+        # No loop signal handlers on Windows; Ctrl+C raises KeyboardInterrupt instead
+        pass
+
     async with serve(
-        echo, "localhost", 8766, ping_interval=None, ping_timeout=None
+        echo,
+        "localhost",
+        8766,
+        ping_interval=None,
+        ping_timeout=None,
+        max_size=2 * 1024 * 1024,  # Room for large echoes, but not unbounded
+        write_limit=SEND_BUFFER_SIZE,
     ) as server:
-        await server.serve_forever()
-    print("Server started. Press Ctrl+C to stop.")
-    try:
-        # Wait for the server to close
-        await server.wait_closed()
-    except asyncio.CancelledError:
-        print("Server is shutting down...")
+        logger.info("Server started. Press Ctrl+C to stop.")
+        await stop.wait()
+        logger.info("Server is shutting down...")
         break_loop = True
-    finally:
-        server.close()
-        await server.wait_closed()
-        print("Server has been shut down.")
+    logger.info("Server has been shut down.")
 
 
 # Run the 'main' function using the 'run' function from the asyncio library
 # This is a blocking call that runs the 'main' function and waits for it to complete
-from websockets.asyncio.server import serve
-
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        run(main)
     except KeyboardInterrupt:
-        print("Keyboard interrupt received. Shutting down...")
+        logger.info("Keyboard interrupt received. Shutting down...")
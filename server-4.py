@@ -1,11 +1,22 @@
 import asyncio
+import logging
 import websockets
-from colorama import Fore, Style, init
 import struct
 import time
 
-# Initialize colorama
-init(autoreset=True)
+# Import the helpers shared by the test servers
+from server_common import (
+    APDU_DISPATCH,
+    MAX_MESSAGE_SIZE,
+    MULTI_WORKER,
+    handle_default,
+    hx,
+    run_workers,
+    set_tcp_nodelay,
+    setup_logging,
+)
+
+logger = logging.getLogger(__name__)
 
 break_loop = False
 
@@ -16,7 +27,8 @@ async def handle_client(websocket: websockets.WebSocketServerProtocol):
     websocket.ping_interval = None  # Disable automatic pings
     websocket.ping_timeout = None   # Disable ping timeout
     
-    print(f"New connection from {websocket.remote_address}")
+    set_tcp_nodelay(websocket)
+    logger.info("New connection from %s", websocket.remote_address)
     
     try:
         while not break_loop:
@@ -29,81 +41,42 @@ async def handle_client(websocket: websockets.WebSocketServerProtocol):
                 # Extract tag from the message (second byte)
                 tag_recvd = message[1] if len(message) > 1 else None
                 
-                print(f"RECVD from client: {' '.join([f'{b:02X}' for b in message])}")
-
-                # Handle different tags
-                if tag_recvd == 91:  # Status Request
-                    print("Status Request received")
-                    random_data = b"\x55\x55\x55\x55"
-                    response = (
-                        tag_recvd.to_bytes(2, byteorder='big') +
-                        len(random_data).to_bytes(2, byteorder='big') +
-                        random_data
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client: STATUS RESPONSE - {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd == 87:  # ATR Request
-                    atr = b"\x3f\x95\x13\x81\x01\x80\x73\xff\x01\x00\x0b"
-                    tag_sent = 88
-                    response = (
-                        tag_sent.to_bytes(2, byteorder='big') +
-                        len(atr).to_bytes(2, byteorder='big') +
-                        atr
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client: ATR - {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd == 89:  # Command APDU
-                    resp = b"\x6d\x82"
-                    tag_sent = 90
-                    response = (
-                        tag_sent.to_bytes(2, byteorder='big') +
-                        len(resp).to_bytes(2, byteorder='big') +
-                        resp
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client ({len(resp)}): {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd in [83, 81]:  # Special tags
-                    print("\nRECEIVED TAG: 81 or 83 (PASSED)\n")
-                    continue
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("RECVD from client: %s", hx(message))
 
-                elif tag_recvd == 85:  # Reset
-                    continue
-
-                else:  # Default response
-                    response = b'\x00\x02\x6d\x82'
-                    await websocket.send(response)
-                    print(f"SENT to Client: {' '.join([f'{b:02X}' for b in response])}\n")
+                handler = APDU_DISPATCH.get(tag_recvd, handle_default)
+                await handler(websocket, message)
 
     except websockets.exceptions.ConnectionClosedError as e:
-        print(f"\nConnection closed: {e}\n")
+        logger.info("\nConnection closed: %s\n", e)
 
 async def main():
     global break_loop
+    # Log to the console; set LOG_LEVEL=DEBUG to see every frame
+    setup_logging(logger)
+
     server = await websockets.serve(
         handle_client,
         "localhost",
         8766,
-        max_size=None  # Allow unlimited message size
+        reuse_port=MULTI_WORKER,  # Only set when several workers share the port
+        max_size=MAX_MESSAGE_SIZE,
+        compression=None,  # APDU frames are small and don't compress; skip deflate
     )
     
-    print("WebSocket Server started on ws://localhost:8765")
-    print("Press Ctrl+C to stop.")
+    logger.info("WebSocket Server started on ws://localhost:8765")
+    logger.info("Press Ctrl+C to stop.")
     
     try:
         await server.wait_closed()
     except asyncio.CancelledError:
-        print("Server is shutting down...")
+        logger.info("Server is shutting down...")
         break_loop = True
     finally:
         server.close()
         await server.wait_closed()
-        print("Server has been shut down.")
+        logger.info("Server has been shut down.")
+
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("\nKeyboard interrupt received. Shutting down...")
\ No newline at end of file
+    run_workers(main)
@@ -1,17 +1,32 @@
 import asyncio
+import concurrent.futures
+import logging
 import websockets
-from colorama import Fore, Style, init
+from websockets.protocol import State
 import struct
 import time
 import platform
 import ctypes
 import os
 from pathlib import Path
+import threading
 import traceback
 from contextlib import contextmanager
 
-# Initialize colorama
-init(autoreset=True)
+# Import the helpers shared by the test servers
+from server_common import (
+    APDU_DISPATCH,
+    CMD_APDU_ERR_PREFIX,
+    MAX_MESSAGE_SIZE,
+    MULTI_WORKER,
+    handle_default,
+    hx,
+    run_workers,
+    set_tcp_nodelay,
+    setup_logging,
+)
+
+logger = logging.getLogger(__name__)
 
 break_loop = False
 
@@ -21,9 +36,18 @@ softoken = None
 server = None
 is_initialized = False
 
+# APDU command/response buffers are reused per thread instead of allocated per call
+COMMAND_BUF_SIZE = 4096
+RESPONSE_BUF_SIZE = 10000
+_apdu_buffers = threading.local()
+
+# SendApdu_softToken blocks, so it runs here instead of on the event loop.
+# A single worker keeps calls into the library serialized, as before.
+_EXEC = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
 def get_library_path():
     system = platform.system()
-    print(f"System: {system} : current path: {os.path.abspath(os.path.dirname(__file__))}")
+    logger.info("System: %s : current path: %s", system, os.path.abspath(os.path.dirname(__file__)))
     if system == "Windows":
         return r".\libsoftoken.dll"
     elif system == "Darwin":  # macOS
@@ -34,13 +58,13 @@ def get_library_path():
         raise OSError(f"Unsupported operating system: {system}")
 
 def load_library():
-    print("Loading library")
+    logger.info("Loading library")
     global softoken
     
     lib_path = get_library_path()
-    print(f"***************** Library path: {lib_path} *******************")
+    logger.info("***************** Library path: %s *******************", lib_path)
     if not os.path.exists(lib_path):
-        print(f"path = {lib_path}")
+        logger.info("path = %s", lib_path)
         raise FileNotFoundError(f"Library file not found: lib_path checked: {lib_path} system: {platform.system()}")
 
     try:
@@ -58,17 +82,17 @@ def load_library():
         return handle
 
     except OSError as e:
-        print(f"Failed to load Softoken library: {e}")
+        logger.error("Failed to load Softoken library: %s", e)
         raise
 
 def unload_library(lib):
     global softoken, logger
-    print("Unloading library")
+    logger.info("Unloading library")
     system = platform.system()
     try:
         if system == "Windows":
             handle = lib._handle
-            print(f"Library handle value: {handle}")
+            logger.info("Library handle value: %s", handle)
             handle_p = ctypes.c_void_p(handle)
 
             result = ctypes.windll.kernel32.FreeLibrary(handle_p)
@@ -97,42 +121,116 @@ def unload_library(lib):
         else:
             raise OSError(f"Unsupported operating system: {system}")
 
-        print("Softoken library unloaded successfully")
+        logger.info("Softoken library unloaded successfully")
         softoken = None
     except Exception as e:
-        print(f"Error unloading library: {e}")
-        print(f"Library handle type: {type(lib._handle)}")
-        print(f"Library handle value: {lib._handle}")
-        print(traceback.format_exc())
+        logger.error("Error unloading library: %s", e)
+        logger.info("Library handle type: %s", type(lib._handle))
+        logger.info("Library handle value: %s", lib._handle)
+        logger.error(traceback.format_exc())
     finally:
         softoken = None
 
+def _response_buffer():
+    """Return this thread's reusable APDU response buffer and length"""
+    if not hasattr(_apdu_buffers, "response"):
+        _apdu_buffers.response = (ctypes.c_ubyte * RESPONSE_BUF_SIZE)()
+        _apdu_buffers.response_len = ctypes.c_int(0)
+    return _apdu_buffers.response, _apdu_buffers.response_len
+
+def _command_buffer(apdu_command):
+    """Copy apdu_command into this thread's reusable ctypes command buffer"""
+    command_len = len(apdu_command)
+    if command_len > COMMAND_BUF_SIZE:
+        # Oversized (extended) APDUs get a one-off buffer
+        return (ctypes.c_ubyte * command_len).from_buffer_copy(apdu_command)
+    if not hasattr(_apdu_buffers, "command"):
+        _apdu_buffers.command = (ctypes.c_ubyte * COMMAND_BUF_SIZE)()
+        _apdu_buffers.command_view = memoryview(_apdu_buffers.command).cast("B")
+    _apdu_buffers.command_view[:command_len] = apdu_command
+    return _apdu_buffers.command
+
 def handle_apdu(apdu_command):
     global softoken, logger
     command_len = len(apdu_command)
-    response_len = ctypes.c_int(10000)
-    response_apdu = (ctypes.c_ubyte * 10000)()
+    response_apdu, response_len = _response_buffer()
+    response_len.value = RESPONSE_BUF_SIZE
 
     try:
         softoken.SendApdu_softToken(
-            (ctypes.c_ubyte * command_len)(*apdu_command),
+            _command_buffer(apdu_command),
             command_len,
             response_apdu,
             ctypes.byref(response_len),
         )
 
-        return bytes(response_apdu[: response_len.value])
+        return bytes(memoryview(response_apdu)[: response_len.value])
     except Exception as e:
-        print(f"APDU processing error: {e}")
+        logger.error("APDU processing error: %s", e)
         raise
 
+def frame_header(payload_len):
+    """Build an unmasked FIN+BINARY WebSocket frame header for payload_len bytes"""
+    if payload_len < 126:
+        return struct.pack('!BB', 0x82, payload_len)
+    if payload_len < 1 << 16:
+        return struct.pack('!BBH', 0x82, 126, payload_len)
+    return struct.pack('!BBQ', 0x82, 127, payload_len)
+
+async def send_frame(websocket, hdr, payload):
+    """Send hdr + payload as one binary message without concatenating them.
+
+    The WebSocket header, hdr and payload are handed to the transport as separate
+    buffers. This is only valid while compression is disabled and no other
+    coroutine is sending on the same connection. Connections that are not OPEN
+    go through websocket.send.
+    """
+    if websocket.state is not State.OPEN:
+        # Never write a data frame after Close; let websockets raise the
+        # appropriate ConnectionClosed error instead
+        await websocket.send(hdr + payload)
+        return
+    websocket.transport.writelines(
+        [frame_header(len(hdr) + len(payload)), hdr, memoryview(payload)]
+    )
+
+async def _handle_cmd_apdu(websocket, message):
+    """Tag 89: command APDU, forwarded to the softoken library"""
+    elapsed_time = time.time() - start_time
+    tag_sent = 90
+    if elapsed_time <= 5:
+        resp = b"\x6d\x82"
+        logger.debug("First 5 seconds: Returning 6D82")
+    else:
+        apdu_command = memoryview(message)[2:]  # Extract command portion without copying
+        try:
+            resp = await asyncio.get_running_loop().run_in_executor(
+                _EXEC, handle_apdu, apdu_command
+            )
+            logger.debug("APDU command processed successfully, response length: %d", len(resp))
+        except Exception as e:
+            logger.error("Error processing APDU command: %s", e)
+            resp = b"\x6d\x82"  # Return error in case of failure
+
+    if resp == b"\x6d\x82":
+        await websocket.send(CMD_APDU_ERR_PREFIX)
+    else:
+        await send_frame(websocket, struct.pack('!HH', tag_sent, len(resp)), resp)
+    if logger.isEnabledFor(logging.DEBUG):
+        response = struct.pack('!HH', tag_sent, len(resp)) + resp
+        logger.debug("SENT to Client (%d): %s\n", len(resp), hx(response))
+
+# Shared handlers, with the command APDU forwarded to the softoken library
+_DISPATCH = {**APDU_DISPATCH, 89: _handle_cmd_apdu}
+
 async def handle_client(websocket: websockets.WebSocketServerProtocol):
     global break_loop, softoken
     # Set shorter ping interval for testing
     websocket.ping_interval = None  # Disable automatic pings
     websocket.ping_timeout = None   # Disable ping timeout
     
-    print(f"New connection from {websocket.remote_address}")
+    set_tcp_nodelay(websocket)
+    logger.info("New connection from %s", websocket.remote_address)
     
     try:
         while not break_loop:
@@ -142,72 +240,20 @@ async def handle_client(websocket: websockets.WebSocketServerProtocol):
 
             if isinstance(message, bytes):
                 tag_recvd = message[1] if len(message) > 1 else None
-                print(f"RECVD from client: {' '.join([f'{b:02X}' for b in message])}")
-
-                # Handle different tags
-                if tag_recvd == 91:  # Status Request
-                    print("Status Request received")
-                    random_data = b"\x55\x55\x55\x55"
-                    response = (
-                        tag_recvd.to_bytes(2, byteorder='big') +
-                        len(random_data).to_bytes(2, byteorder='big') +
-                        random_data
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client: STATUS RESPONSE - {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd == 87:  # ATR Request
-                    atr = b"\x3f\x95\x13\x81\x01\x80\x73\xff\x01\x00\x0b"
-                    tag_sent = 88
-                    response = (
-                        tag_sent.to_bytes(2, byteorder='big') +
-                        len(atr).to_bytes(2, byteorder='big') +
-                        atr
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client: ATR - {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd == 89:  # Command APDU
-                    elapsed_time = time.time() - start_time
-                    tag_sent = 90
-                    if elapsed_time <= 5:
-                        resp = b"\x6d\x82"
-                        print("First 5 seconds: Returning 6D82")
-                    else:
-                        apdu_command = message[2::]  # Extract command portion
-                        try:
-                            resp = handle_apdu(apdu_command)
-                            print(f"APDU command processed successfully, response length: {len(resp)}")
-                        except Exception as e:
-                            print(f"Error processing APDU command: {e}")
-                            resp = b"\x6d\x82"  # Return error in case of failure
-                        
-                    response = (
-                        tag_sent.to_bytes(2, byteorder='big') +
-                        len(resp).to_bytes(2, byteorder='big') +
-                        resp
-                    )
-                    await websocket.send(response)
-                    print(f"SENT to Client ({len(resp)}): {' '.join([f'{b:02X}' for b in response])}\n")
-
-                elif tag_recvd in [83, 81]:  # Special tags
-                    print("\nRECEIVED TAG: 81 or 83 (PASSED)\n")
-                    continue
-
-                elif tag_recvd == 85:  # Reset
-                    continue
-
-                else:  # Default response
-                    response = b'\x00\x02\x6d\x82'
-                    await websocket.send(response)
-                    print(f"SENT to Client: {' '.join([f'{b:02X}' for b in response])}\n")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("RECVD from client: %s", hx(message))
+
+                handler = _DISPATCH.get(tag_recvd, handle_default)
+                await handler(websocket, message)
 
     except websockets.exceptions.ConnectionClosedError as e:
-        print(f"\nConnection closed: {e}\n")
+        logger.info("\nConnection closed: %s\n", e)
 
 async def main():
     global break_loop, softoken, is_initialized
-    
+    # Log to the console; set LOG_LEVEL=DEBUG to see every frame
+    setup_logging(logger)
+
     # Load and initialize library once at startup
     try:
         if not is_initialized:
@@ -216,39 +262,41 @@ async def main():
             if result != 0:
                 raise RuntimeError(f"Failed to initialize softoken, error code: {result}")
             is_initialized = True
-            print("Library loaded and initialized successfully")
+            logger.info("Library loaded and initialized successfully")
     except Exception as e:
-        print(f"Error loading/initializing library: {e}")
+        logger.error("Error loading/initializing library: %s", e)
         return
 
     server = await websockets.serve(
         handle_client,
         "localhost",
         8765,
-        max_size=None  # Allow unlimited message size
+        reuse_port=MULTI_WORKER,  # Only set when several workers share the port
+        max_size=MAX_MESSAGE_SIZE,
+        compression=None,  # APDU frames are small and don't compress; skip deflate
     )
     
-    print("WebSocket Server started on ws://localhost:8765")
-    print("Press Ctrl+C to stop.")
+    logger.info("WebSocket Server started on ws://localhost:8765")
+    logger.info("Press Ctrl+C to stop.")
     
     try:
         await server.wait_closed()
     except asyncio.CancelledError:
-        print("Server is shutting down...")
+        logger.info("Server is shutting down...")
         break_loop = True
     finally:
+        server.close()
+        await server.wait_closed()
+        # Let in-flight APDUs finish before the library goes away; the wait
+        # happens off the event loop thread
+        await asyncio.to_thread(_EXEC.shutdown)
         if softoken:
             try:
                 unload_library(softoken)
-                print("Library unloaded successfully")
+                logger.info("Library unloaded successfully")
             except Exception as e:
-                print(f"Error unloading library: {e}")
-        server.close()
-        await server.wait_closed()
-        print("Server has been shut down.")
+                logger.error("Error unloading library: %s", e)
+        logger.info("Server has been shut down.")
 
 if __name__ == "__main__":
-    try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        print("\nKeyboard interrupt received. Shutting down...")
\ No newline at end of file
+    run_workers(main)
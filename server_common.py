@@ -0,0 +1,187 @@
+"""Helpers shared by the Python test servers (server-2.py ... server-5.py)"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+# uvloop is a faster drop-in event loop; it is not available on Windows
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+logger = logging.getLogger(__name__)
+
+# Opt-in worker processes sharing the port (WORKERS=N); needs SO_REUSEPORT
+WORKERS = int(os.environ.get("WORKERS", 1))
+MULTI_WORKER = WORKERS > 1 and hasattr(socket, "SO_REUSEPORT")
+# Seconds the workers get to shut down on their own before the parent sends
+# them SIGINT, and then before it gives up and terminates them
+WORKER_STOP_GRACE = 2
+WORKER_STOP_TIMEOUT = 10
+
+# The APDU servers (server-4.py, server-5.py) share the constants below.
+# Largest inbound message: 2-byte tag prefix + extended APDU
+# (4-byte header, 3-byte Lc, up to 65535 data bytes, 3-byte Le)
+MAX_MESSAGE_SIZE = 2 + 4 + 3 + 65535 + 3
+
+# Fixed responses, built once instead of on every request
+STATUS_RESP = (91).to_bytes(2, byteorder='big') + (4).to_bytes(2, byteorder='big') + b"\x55\x55\x55\x55"
+ATR_RESP = (88).to_bytes(2, byteorder='big') + (11).to_bytes(2, byteorder='big') + b"\x3f\x95\x13\x81\x01\x80\x73\xff\x01\x00\x0b"
+# Command APDU response (tag 90) carrying the 6D82 error status
+CMD_APDU_ERR_PREFIX = (90).to_bytes(2, byteorder='big') + (2).to_bytes(2, byteorder='big') + b"\x6d\x82"
+DEFAULT_RESP = b'\x00\x02\x6d\x82'
+
+
+class ColorFormatter(logging.Formatter):
+    """Color records by level with ANSI escapes; only used on a terminal"""
+
+    COLORS = {
+        logging.DEBUG: "\033[36m",
+        logging.WARNING: "\033[33m",
+        logging.ERROR: "\033[31m",
+        logging.CRITICAL: "\033[31m",
+    }
+
+    def format(self, record):
+        message = super().format(record)
+        color = self.COLORS.get(record.levelno)
+        return f"{color}{message}\033[0m" if color else message
+
+
+def setup_logging(logger):
+    """Log to the console; LOG_LEVEL (default INFO) selects the level.
+
+    The shared APDU handlers below log through this module's logger, which
+    gets the same handler and level as the server's own logger.
+    """
+    handler = logging.StreamHandler()
+    # Colors only for an interactive (non-Windows) terminal; plain text otherwise
+    if handler.stream.isatty() and os.name != "nt":
+        handler.setFormatter(ColorFormatter("%(message)s"))
+    else:
+        handler.setFormatter(logging.Formatter("%(message)s"))
+    level = os.environ.get("LOG_LEVEL", "INFO").upper()
+    for target in (logger, logging.getLogger(__name__)):
+        target.addHandler(handler)
+        target.setLevel(level)
+
+
+def run(main):
+    """Run the 'main' coroutine function, on uvloop when it is installed"""
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
+
+
+def _run_worker(main):
+    try:
+        run(main)
+    except KeyboardInterrupt:
+        logger.info("\nKeyboard interrupt received. Shutting down...")
+
+
+def run_workers(main):
+    """Run 'main' here, or in WORKERS processes sharing the port when MULTI_WORKER"""
+    if not MULTI_WORKER:
+        _run_worker(main)
+        return
+    workers = [multiprocessing.Process(target=_run_worker, args=(main,)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+    # SIGTERM stops the parent like Ctrl+C instead of orphaning the workers;
+    # installed after the workers started so they keep the default handler
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        _stop_workers(workers)
+
+
+def _stop_workers(workers):
+    """Shut the workers down and wait for them.
+
+    Ctrl+C reaches the whole process group, but a SIGINT or SIGTERM sent to
+    the parent alone does not, so workers still running after the grace period
+    get SIGINT, and are terminated if even that does not stop them.
+    """
+    deadline = time.monotonic() + WORKER_STOP_GRACE
+    for worker in workers:
+        worker.join(max(0, deadline - time.monotonic()))
+    for worker in workers:
+        if worker.is_alive():
+            os.kill(worker.pid, signal.SIGINT)
+    deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+    for worker in workers:
+        worker.join(max(0, deadline - time.monotonic()))
+        if worker.is_alive():
+            worker.terminate()
+            worker.join()
+
+
+def hx(data):
+    """Format bytes as space separated upper-case hex, e.g. '00 5B'"""
+    return data.hex(" ").upper()
+
+
+def set_tcp_nodelay(websocket):
+    """Disable Nagle so small frames go out without waiting for ACKs"""
+    sock = websocket.transport.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+async def handle_status(websocket, message):
+    """Tag 91: status request"""
+    logger.debug("Status Request received")
+    await websocket.send(STATUS_RESP)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SENT to Client: STATUS RESPONSE - %s\n", hx(STATUS_RESP))
+
+
+async def handle_atr(websocket, message):
+    """Tag 87: ATR request"""
+    await websocket.send(ATR_RESP)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SENT to Client: ATR - %s\n", hx(ATR_RESP))
+
+
+async def handle_cmd_apdu(websocket, message):
+    """Tag 89: command APDU, always answered with 6D82"""
+    await websocket.send(CMD_APDU_ERR_PREFIX)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SENT to Client (2): %s\n", hx(CMD_APDU_ERR_PREFIX))
+
+
+async def handle_special(websocket, message):
+    """Tags 81 and 83: acknowledged without a response"""
+    logger.debug("\nRECEIVED TAG: 81 or 83 (PASSED)\n")
+
+
+async def handle_reset(websocket, message):
+    """Tag 85: reset, no response"""
+
+
+async def handle_default(websocket, message):
+    """Any other tag"""
+    await websocket.send(DEFAULT_RESP)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("SENT to Client: %s\n", hx(DEFAULT_RESP))
+
+
+# Handler per received tag (second byte of the message); servers may override
+# entries, server-5 replaces tag 89
+APDU_DISPATCH = {
+    91: handle_status,  # Status Request
+    87: handle_atr,  # ATR Request
+    89: handle_cmd_apdu,  # Command APDU
+    81: handle_special,
+    83: handle_special,
+    85: handle_reset,
+}